@@ -1,55 +1,108 @@
 #!/usr/bin/env python3
+import json
 import sys
-import re
-from functools import reduce
+from functools import lru_cache, reduce
+from itertools import islice
 
 from lib.logger import log
-from lib.api import ImmichAPI
+from lib.api import ImmichAPI, UUID_RE
+from lib.cache import DiskCache
 from lib.config import get_config, has_search_actions
-from lib.filter import Filter, normalize_query, load_json_file, normalize_json_query
+from lib.filter import Filter, normalize_query, load_json_file, normalize_json_query, required_asset_fields
 
 
 def get_asset_set(assets):
     return {asset['id'] for asset in assets}
 
 
+def collect_assets(all_search_assets, assets, asset_ids=None):
+    """Adds search results to the id -> asset table, keeping one copy per asset, and
+    adds their ids to asset_ids (a new set if not given), which is returned."""
+    if asset_ids is None:
+        asset_ids = set()
+    add_id = asset_ids.add
+    for asset in assets:
+        asset_id = asset['id']
+        all_search_assets.setdefault(asset_id, asset)
+        add_id(asset_id)
+    return asset_ids
+
+
+def union_early_stop(union_assets, union_limit):
+    """Returns an execute_search early_stop callback that fires once union_assets
+    plus the assets found so far reach union_limit, or None without a limit."""
+    if not union_limit:
+        return None
+    return lambda assets: len(union_assets) + len(get_asset_set(assets) - union_assets) >= union_limit
+
+
+# The same rule file may be listed for several flags; read and parse it only once
+@lru_cache(maxsize=None)
+def normalize_rule(rule, search_type, default_smart_result_limit, verbose):
+    """Returns the search query for a rule. The result is shared; copy before changing it."""
+    if search_type == 'smart':
+        return normalize_query(rule, default_smart_result_limit, verbose)
+    return normalize_json_query(rule, verbose)
+
+
+def run_searches(immich_api, queries, search_type, concurrent=False, early_stop=None):
+    """Yields each query's search results in order. Concurrent searches all start
+    up front; otherwise each search only runs once the caller asks for it, so a
+    caller that stops iterating early skips the remaining round-trips."""
+    if concurrent:
+        yield from immich_api.execute_searches(queries, search_type)
+        return
+    for query in queries:
+        yield immich_api.execute_search(query, search_type, early_stop=early_stop)
+
+
 def _process_filters(
     immich_api,
     all_search_assets,
     union_rules,
     intersection_rules,
     search_type='metadata',
-    default_smart_result_limit=200
+    default_smart_result_limit=200,
+    stop_when_empty=False,
+    union_limit=None
 ):
+    def normalize_rules(rules):
+        queries = [normalize_rule(rule, search_type, default_smart_result_limit, immich_api.verbose)
+                   for rule in rules]
+        return [dict(query) for query in queries if query]
+
+    # Searches run concurrently unless an early stop may make the later ones unnecessary
     union_assets = set()
     if union_rules:
-        for rule in union_rules:
-            if search_type == 'smart':
-                query = normalize_query(rule, default_smart_result_limit, immich_api.verbose)
-            else:
-                query = normalize_json_query(rule, immich_api.verbose)
-
-            if query:
-                assets = immich_api.execute_search(query, search_type)
-                all_search_assets.extend(assets)
-                union_assets.update(get_asset_set(assets))
-
-    intersection_assets = set()
+        for assets in run_searches(immich_api, normalize_rules(union_rules), search_type,
+                                   concurrent=not union_limit,
+                                   early_stop=union_early_stop(union_assets, union_limit)):
+            collect_assets(all_search_assets, assets, union_assets)
+            if union_limit and len(union_assets) >= union_limit:
+                log(f"Found {len(union_assets)} {search_type} assets, skipping remaining union rules",
+                    verbose_only=True, verbose=immich_api.verbose)
+                break
+
+    intersection_assets = None
     if intersection_rules:
-        all_intersection_sets = []
-        for rule in intersection_rules:
-            if search_type == 'smart':
-                query = normalize_query(rule, default_smart_result_limit, immich_api.verbose)
+        for assets in run_searches(immich_api, normalize_rules(intersection_rules), search_type,
+                                   concurrent=not stop_when_empty):
+            asset_ids = collect_assets(all_search_assets, assets)
+            if intersection_assets is None:
+                intersection_assets = asset_ids
             else:
-                query = normalize_json_query(rule, immich_api.verbose)
-
-            if query:
-                assets = immich_api.execute_search(query, search_type)
-                all_search_assets.extend(assets)
-                all_intersection_sets.append(get_asset_set(assets))
-
-        if all_intersection_sets:
-            intersection_assets = set.intersection(*all_intersection_sets)
+                intersection_assets &= asset_ids
+            log(f"Running {search_type} intersection: {len(intersection_assets)} assets",
+                verbose_only=True, verbose=immich_api.verbose)
+            # For includes, an empty running intersection cannot grow again, so
+            # the remaining searches would be wasted round-trips.
+            if stop_when_empty and not intersection_assets:
+                log(f"{search_type} intersection is already empty, skipping remaining rules",
+                    verbose_only=True, verbose=immich_api.verbose)
+                break
+
+    if intersection_assets is None:
+        intersection_assets = set()
 
     if union_rules and intersection_rules:
         return union_assets.intersection(intersection_assets)
@@ -61,7 +114,7 @@ def _process_filters(
         return None
 
 
-def process_query_filters(filter_type, args, immich_api, all_search_assets):
+def process_query_filters(filter_type, args, immich_api, all_search_assets, union_limit=None):
     """Processes query-based filters (metadata, smart) for include and exclude."""
 
     include_union_files_list_of_lists = getattr(args, f"include_{filter_type}_union", None)
@@ -76,7 +129,9 @@ def process_query_filters(filter_type, args, immich_api, all_search_assets):
         include_union_files,
         include_intersection_files,
         search_type=filter_type,
-        default_smart_result_limit=args.default_smart_result_limit
+        default_smart_result_limit=args.default_smart_result_limit,
+        stop_when_empty=True,
+        union_limit=union_limit
     )
 
     exclude_union_files_list_of_lists = getattr(args, f"exclude_{filter_type}_union", None)
@@ -97,27 +152,33 @@ def process_query_filters(filter_type, args, immich_api, all_search_assets):
     return include_assets, exclude_assets or set()
 
 
-def process_person_filters(args, immich_api, all_search_assets):
+def process_person_filters(args, immich_api, all_search_assets, union_limit=None):
     """Processes person name filters for include and exclude."""
 
     # Includes
     person_includes = None
     include_union_assets = set()
     if args.include_person_ids_union:
-        for person_id in args.include_person_ids_union:
-            assets = immich_api.execute_search({"personIds": [person_id]}, "metadata")
-            all_search_assets.extend(assets)
-            include_union_assets.update(get_asset_set(assets))
-
-    include_intersection_assets = set()
+        queries = [{"personIds": [person_id]} for person_id in args.include_person_ids_union]
+        for assets in run_searches(immich_api, queries, "metadata", concurrent=not union_limit,
+                                   early_stop=union_early_stop(include_union_assets, union_limit)):
+            collect_assets(all_search_assets, assets, include_union_assets)
+            if union_limit and len(include_union_assets) >= union_limit:
+                break
+
+    include_intersection_assets = None
     if args.include_person_ids_intersection:
-        intersection_sets = []
-        for person_id in args.include_person_ids_intersection:
-            assets = immich_api.execute_search({"personIds": [person_id]}, "metadata")
-            all_search_assets.extend(assets)
-            intersection_sets.append(get_asset_set(assets))
-        if intersection_sets:
-            include_intersection_assets = set.intersection(*intersection_sets)
+        queries = [{"personIds": [person_id]} for person_id in args.include_person_ids_intersection]
+        for assets in run_searches(immich_api, queries, "metadata"):
+            asset_ids = collect_assets(all_search_assets, assets)
+            if include_intersection_assets is None:
+                include_intersection_assets = asset_ids
+            else:
+                include_intersection_assets &= asset_ids
+            if not include_intersection_assets:
+                break
+    if include_intersection_assets is None:
+        include_intersection_assets = set()
 
     if args.include_person_ids_union and args.include_person_ids_intersection:
         person_includes = include_union_assets.intersection(include_intersection_assets)
@@ -126,27 +187,61 @@ def process_person_filters(args, immich_api, all_search_assets):
     elif args.include_person_ids_intersection:
         person_includes = include_intersection_assets
 
-    # Excludes
+    # Excludes never stop early, so their searches all run concurrently
     person_excludes = set()
     if args.exclude_person_ids_union:
-        for person_id in args.exclude_person_ids_union:
-            assets = immich_api.execute_search({"personIds": [person_id]}, "metadata")
-            all_search_assets.extend(assets)
-            person_excludes.update(get_asset_set(assets))
+        queries = [{"personIds": [person_id]} for person_id in args.exclude_person_ids_union]
+        for assets in run_searches(immich_api, queries, "metadata", concurrent=True):
+            collect_assets(all_search_assets, assets, person_excludes)
 
     if args.exclude_person_ids_intersection:
-        intersection_sets = []
-        for person_id in args.exclude_person_ids_intersection:
-            assets = immich_api.execute_search({"personIds": [person_id]}, "metadata")
-            all_search_assets.extend(assets)
-            intersection_sets.append(get_asset_set(assets))
-        if intersection_sets:
-            person_excludes.update(set.intersection(*intersection_sets))
+        exclude_intersection_assets = None
+        queries = [{"personIds": [person_id]} for person_id in args.exclude_person_ids_intersection]
+        for assets in run_searches(immich_api, queries, "metadata", concurrent=True):
+            asset_ids = collect_assets(all_search_assets, assets)
+            if exclude_intersection_assets is None:
+                exclude_intersection_assets = asset_ids
+            else:
+                exclude_intersection_assets &= asset_ids
+        person_excludes.update(exclude_intersection_assets)
 
     return person_includes, person_excludes
 
-def process_local_filters(args, asset_list_for_local_filtering):
-    """Processes local filters for include and exclude."""
+def fuse_person_includes(args):
+    """Folds the person include filter into the metadata include search when there is
+    exactly one, saving the per-person searches. Immich returns assets containing all
+    of the given personIds, so this only applies when every listed person is required:
+    a person intersection, or a union of a single person."""
+    person_ids = None
+    if args.include_person_ids_intersection and not args.include_person_ids_union:
+        person_ids = args.include_person_ids_intersection
+    elif args.include_person_ids_union and not args.include_person_ids_intersection and \
+            len(args.include_person_ids_union) == 1:
+        person_ids = args.include_person_ids_union
+    if not person_ids or not all(isinstance(person_id, str) for person_id in person_ids):
+        return
+
+    union_rules = [rule for sublist in args.include_metadata_union or [] for rule in sublist]
+    intersection_rules = [rule for sublist in args.include_metadata_intersection or [] for rule in sublist]
+    if len(union_rules) + len(intersection_rules) != 1:
+        return
+    query = normalize_rule((union_rules or intersection_rules)[0], 'metadata',
+                           args.default_smart_result_limit, args.verbose)
+    # A resultLimit would cap the fused search instead of the metadata search alone
+    if not query or "resultLimit" in query or not isinstance(query.get("personIds", []), list):
+        return
+
+    fused = dict(query)
+    fused["personIds"] = list(dict.fromkeys(query.get("personIds", []) + list(person_ids)))
+    setattr(args, 'include_metadata_union' if union_rules else 'include_metadata_intersection',
+            [[json.dumps(fused)]])
+    args.include_person_ids_union = None
+    args.include_person_ids_intersection = None
+    log(f"Merged person include filter into the metadata search: {fused}",
+        verbose_only=True, verbose=args.verbose)
+
+def parse_local_filters(args):
+    """Parses the local filter arguments into include/exclude, union/intersection filter lists."""
 
     local_filter = Filter(args.verbose)
     flat_include_local_filter_union = [item for sublist in args.include_local_filter_union for item in sublist] if args.include_local_filter_union else None
@@ -162,6 +257,16 @@ def process_local_filters(args, asset_list_for_local_filtering):
     local_exclude_intersection_filters = local_filter.parse_filters(
         flat_exclude_local_filter_intersection)
 
+    return (local_include_union_filters, local_include_intersection_filters,
+            local_exclude_union_filters, local_exclude_intersection_filters)
+
+def process_local_filters(args, local_filters, asset_list_for_local_filtering):
+    """Processes local filters for include and exclude."""
+
+    local_filter = Filter(args.verbose)
+    (local_include_union_filters, local_include_intersection_filters,
+     local_exclude_union_filters, local_exclude_intersection_filters) = local_filters
+
     local_include_assets = None
     if local_include_union_filters or local_include_intersection_filters:
         local_includes_union = local_filter.apply_local_filters(
@@ -177,6 +282,11 @@ def process_local_filters(args, asset_list_for_local_filtering):
         else:
             local_include_assets = local_includes_intersection
 
+    # Only assets that survived the include filters can still be excluded
+    if local_include_assets is not None and (local_exclude_union_filters or local_exclude_intersection_filters):
+        asset_list_for_local_filtering = [asset for asset in asset_list_for_local_filtering
+                                          if asset["id"] in local_include_assets]
+
     local_excludes_union = local_filter.apply_local_filters(
         asset_list_for_local_filtering, local_exclude_union_filters, is_include=False, use_intersection=False)
     local_excludes_intersection = local_filter.apply_local_filters(
@@ -186,38 +296,52 @@ def process_local_filters(args, asset_list_for_local_filtering):
 
     return local_include_assets, local_exclude_assets
 
-def get_final_asset_ids(args, immich_api, all_search_assets, metadata_includes, smart_includes, person_includes, metadata_excludes, smart_excludes, person_excludes):
+def get_search_asset_limit(args, local_filters):
+    """Returns --max-assets when the final result is just the union of one family of
+    include searches, so searching can stop as soon as that many assets are found."""
+    if not args.max_assets or any(local_filters):
+        return None
+    union_flags = ['include_metadata_union', 'include_smart_union', 'include_person_ids_union']
+    other_flags = [
+        'include_metadata_intersection', 'include_smart_intersection', 'include_person_ids_intersection',
+        'exclude_metadata_union', 'exclude_metadata_intersection',
+        'exclude_smart_union', 'exclude_smart_intersection',
+        'exclude_person_ids_union', 'exclude_person_ids_intersection'
+    ]
+    if sum(1 for flag in union_flags if getattr(args, flag)) != 1:
+        return None
+    if any(getattr(args, flag) for flag in other_flags):
+        return None
+    return args.max_assets
+
+def get_final_asset_ids(args, immich_api, all_search_assets, local_filters, metadata_includes, smart_includes, person_includes, metadata_excludes, smart_excludes, person_excludes):
     # Combine all includes
     include_sets = [s for s in [
         metadata_includes, smart_includes, person_includes] if s is not None]
     if not include_sets:
         # If no include filters are specified, start with all assets from exclude queries
         # This is because local filters need a base set of assets to work with.
-        unique_assets_from_all = {
-            asset["id"]: asset for asset in all_search_assets}
-        final_included_assets = set(unique_assets_from_all.keys())
+        final_included_assets = set(all_search_assets)
     else:
-        final_included_assets = set.intersection(*include_sets)
-
-    # Process Local Filters
-    unique_assets_from_all = {
-        asset["id"]: asset for asset in all_search_assets}
-    asset_list_for_local_filtering = [unique_assets_from_all[asset_id]
-                                      for asset_id in final_included_assets if asset_id in unique_assets_from_all]
-
-    local_include_assets, local_exclude_assets = process_local_filters(
-        args, asset_list_for_local_filtering)
-
+        # Start from the smallest set so every step iterates as few ids as possible
+        final_included_assets = set.intersection(*sorted(include_sets, key=len))
+
+    # Process Local Filters; without any, there is no need to look the assets up
+    local_include_assets, local_exclude_assets = None, set()
+    if any(local_filters):
+        asset_list_for_local_filtering = [asset for asset in map(all_search_assets.get, final_included_assets)
+                                          if asset is not None]
+        local_include_assets, local_exclude_assets = process_local_filters(
+            args, local_filters, asset_list_for_local_filtering)
+
+    # final_included_assets is always a fresh set here, so narrow it in place
     if local_include_assets is not None:
-        final_included_assets = final_included_assets.intersection(
-            local_include_assets)
+        final_included_assets.intersection_update(local_include_assets)
 
-    # Combine all excludes
-    final_excluded_assets = metadata_excludes.union(
-        smart_excludes, person_excludes, local_exclude_assets)
-
-    # Final Calculation
-    final_asset_ids = final_included_assets - final_excluded_assets
+    # Final Calculation: drop every exclude set without building their union first
+    final_asset_ids = final_included_assets
+    for excluded_assets in (metadata_excludes, smart_excludes, person_excludes, local_exclude_assets):
+        final_asset_ids.difference_update(excluded_assets)
 
     return final_asset_ids
 
@@ -227,14 +351,21 @@ def resolve_and_validate_names(args, immich_api):
     if args.include_person_names_union or args.include_person_names_intersection or \
        args.exclude_person_names_union or args.exclude_person_names_intersection:
         all_people_data = immich_api._fetch_all_people()
+        if all_people_data and immich_api.cache is not None:
+            # A cached people list may predate a newly named person
+            known_names = {person.get('name') for person in all_people_data}
+            requested_names = {name for flag in ('include_person_names_union', 'include_person_names_intersection',
+                                                 'exclude_person_names_union', 'exclude_person_names_intersection')
+                               for sublist in getattr(args, flag) or [] for name in sublist}
+            if any(name not in known_names and not UUID_RE.fullmatch(name) for name in requested_names):
+                all_people_data = immich_api._fetch_all_people(refresh=True)
         if not all_people_data:
             log("Could not fetch people data from Immich.", fg="red")
             sys.exit(1)
 
     if args.album:
         album_id = args.album
-        uuid_regex = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
-        if not uuid_regex.match(album_id):
+        if not UUID_RE.fullmatch(album_id):
             log(f"Album '{album_id}' is not a UUID, resolving to ID...", verbose_only=False, verbose=args.verbose)
             resolved_album_id = immich_api.get_album_id_from_name(album_id)
             if not resolved_album_id:
@@ -276,6 +407,8 @@ def main():
         return 1
 
     immich_api = ImmichAPI(args.server, args.key, args.verbose)
+    if args.cache_ttl > 0 and not args.no_cache:
+        immich_api.cache = DiskCache(args.cache_dir, args.cache_ttl, args.verbose)
 
     resolve_and_validate_names(args, immich_api)
 
@@ -288,19 +421,29 @@ def main():
         immich_api.get_people()
         return 0
 
-    all_search_assets = []
+    # Local filters only read a few asset fields; keep just those from search results.
+    local_filters = parse_local_filters(args)
+    immich_api.asset_fields = required_asset_fields(
+        [f for filters in local_filters for f in filters])
+    # Assets the local include filters would reject are dropped while searching
+    immich_api.asset_predicate = Filter(args.verbose).build_include_predicate(
+        local_filters[0], local_filters[1])
+
+    all_search_assets = {}
+    search_asset_limit = get_search_asset_limit(args, local_filters)
+    fuse_person_includes(args)
 
     # Process Metadata and Smart filters
     metadata_includes, metadata_excludes = process_query_filters(
-        "metadata", args, immich_api, all_search_assets)
+        "metadata", args, immich_api, all_search_assets, search_asset_limit)
     smart_includes, smart_excludes = process_query_filters(
-        "smart", args, immich_api, all_search_assets)
+        "smart", args, immich_api, all_search_assets, search_asset_limit)
 
     # Process Person name filters
     person_includes, person_excludes = process_person_filters(
-        args, immich_api, all_search_assets)
+        args, immich_api, all_search_assets, search_asset_limit)
 
-    final_asset_ids = get_final_asset_ids(args, immich_api, all_search_assets, metadata_includes, smart_includes, person_includes, metadata_excludes, smart_excludes, person_excludes)
+    final_asset_ids = get_final_asset_ids(args, immich_api, all_search_assets, local_filters, metadata_includes, smart_includes, person_includes, metadata_excludes, smart_excludes, person_excludes)
 
     log(f"Final merged asset IDs after applying all criteria: {len(final_asset_ids)} assets",
         verbose_only=False, verbose=args.verbose)
@@ -308,7 +451,7 @@ def main():
     if final_asset_ids and args.max_assets and len(final_asset_ids) > args.max_assets:
         log(f"Limiting to {args.max_assets} assets (from {len(final_asset_ids)})",
             verbose_only=False, verbose=args.verbose)
-        final_asset_ids = set(list(final_asset_ids)[:args.max_assets])
+        final_asset_ids = set(islice(final_asset_ids, args.max_assets))
 
     if final_asset_ids:
         log(f"\nFinal assets selected: {len(final_asset_ids)}",
@@ -1,9 +1,26 @@
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import re
 from .logger import log
+from . import jsonutil
 from tabulate import tabulate
+from concurrent.futures import ThreadPoolExecutor
+
+# Maximum number of search result pages requested concurrently.
+SEARCH_PREFETCH_PAGES = 8
+# Maximum number of independent searches run concurrently.
+SEARCH_WORKERS = 4
+# Maximum number of album update requests sent concurrently.
+ALBUM_UPDATE_WORKERS = 4
+# (connect, read) timeout in seconds, so a stalled connection can't hang a worker forever.
+REQUEST_TIMEOUT = (10, 120)
+# Transient HTTP statuses retried on idempotent requests.
+RETRY_STATUSES = (429, 502, 503, 504)
+# Immich ids are lowercase UUIDs; use with fullmatch so trailing text is rejected.
+UUID_RE = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
 
 class ImmichAPI:
     def __init__(self, server_url, api_key, verbose=False):
@@ -18,35 +35,56 @@ class ImmichAPI:
             "Content-Type": "application/json"
         }
         self.albums = None
+        self.people = None
+        self.person_map = None
+        # When set, search results are trimmed to these top-level keys as each page arrives.
+        self.asset_fields = None
+        # When set, search results failing this predicate are dropped as each page arrives.
+        self.asset_predicate = None
+        # When set (a lib.cache.DiskCache), completed searches, people and albums are stored and reused.
+        self.cache = None
+        # Completed searches of this run, so a query repeated across rules is only sent once.
+        self._search_results = {}
+
+        # One pooled keep-alive session for every request, so paginated searches
+        # and chunked album updates don't pay a TCP/TLS handshake per call.
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # Idempotent calls are also retried on transient server errors; the last
+        # response is still returned so raise_for_status reports it as before.
+        retry = Retry(total=3, backoff_factor=0.3, status_forcelist=RETRY_STATUSES, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
     def _request(self, method, url, params=None, json_data=None):
-        log(f"API {method} request to {url}", verbose_only=True, verbose=self.verbose)
+        log("API {} request to {}", method, url, verbose_only=True, verbose=self.verbose)
         if params:
-            log(f"Params: {params}", verbose_only=True, verbose=self.verbose)
+            log("Params: {}", params, verbose_only=True, verbose=self.verbose)
         if json_data:
-            log(f"Payload: {json_data}", verbose_only=True, verbose=self.verbose)
+            log("Payload: {}", json_data, verbose_only=True, verbose=self.verbose)
         try:
-            if method.lower() == 'get':
-                response = requests.get(url, headers=self.headers, params=params)
-            elif method.lower() == 'post':
-                response = requests.post(url, headers=self.headers, json=json_data)
-            elif method.lower() == 'put':
-                response = requests.put(url, headers=self.headers, json=json_data)
-            else:
-                log(f"Unsupported method: {method}", fg="red", verbose_only=False, verbose=self.verbose)
-                return None
-            
-            log(f"Response status: {response.status_code}", verbose_only=True, verbose=self.verbose)
-            text = response.text if len(response.text) <= 4500 else response.text[:4500] + "..."
-            log(f"Response: {text}", verbose_only=True, verbose=self.verbose)
+            # Content-Type is already set on the session, so the payload is sent pre-encoded
+            payload = jsonutil.dumps(json_data) if json_data is not None else None
+            response = self.session.request(method.upper(), url, params=params, data=payload, timeout=REQUEST_TIMEOUT)
+
+            body = response.content
+            if self.verbose:
+                # Only decode the part of the body that is logged.
+                preview = body[:4500].decode(response.encoding or "utf-8", errors="replace")
+                log(f"Response status: {response.status_code}", verbose_only=True, verbose=self.verbose)
+                log(f"Response: {preview}{'...' if len(body) > 4500 else ''}", verbose_only=True, verbose=self.verbose)
 
             if not response.ok:
                 log(f"API request failed: {response.status_code} - {response.text}", fg="red", verbose_only=False, verbose=self.verbose)
                 return None
-            return response.json() if response.text else None
+            return jsonutil.loads(body) if body else None
         except requests.exceptions.RequestException as e:
             log(f"API request error: {str(e)}", fg="red", verbose_only=False, verbose=self.verbose)
             return None
+        except jsonutil.JSONDecodeError as e:
+            log(f"Invalid JSON in API response: {str(e)}", fg="red", verbose_only=False, verbose=self.verbose)
+            return None
 
     def get_user_info(self):
         url = f"{self.server_url}/api/users/me"
@@ -60,25 +98,31 @@ class ImmichAPI:
             log("Failed to retrieve user information", fg="red", verbose_only=False, verbose=self.verbose)
             return None
 
-    def _get_albums_data(self):
-        if self.albums is not None:
+    def _get_albums_data(self, refresh=False):
+        if self.albums is not None and not refresh:
             return self.albums
 
+        cache_key = ["albums", self.server_url, self.api_key]
+        if self.cache is not None and not refresh:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                log("Using cached album list", verbose_only=True, verbose=self.verbose)
+                self.albums = cached
+                return self.albums
+
         log("Fetching all albums...", verbose_only=False, verbose=self.verbose)
-        
+
         # Fetch shared albums
         url_shared = f"{self.server_url}/api/albums?shared=true"
         shared_albums = self._request('get', url_shared)
-        if shared_albums is None:
-            shared_albums = []
 
         # Fetch non-shared albums
         url_not_shared = f"{self.server_url}/api/albums?shared=false"
         not_shared_albums = self._request('get', url_not_shared)
-        if not_shared_albums is None:
-            not_shared_albums = []
 
-        self.albums = shared_albums + not_shared_albums
+        if shared_albums is not None and not_shared_albums is not None and self.cache is not None:
+            self.cache.set(cache_key, shared_albums + not_shared_albums)
+        self.albums = (shared_albums or []) + (not_shared_albums or [])
         return self.albums
 
     def get_albums(self):
@@ -102,6 +146,10 @@ class ImmichAPI:
             return None
 
         matching_albums = [a for a in albums if a['albumName'] == album_name]
+        if not matching_albums and self.cache is not None:
+            # A cached album list may predate the album
+            albums = self._get_albums_data(refresh=True)
+            matching_albums = [a for a in albums if a['albumName'] == album_name]
 
         if not matching_albums:
             log(f"No album found with name '{album_name}'", fg="red", verbose_only=False, verbose=self.verbose)
@@ -129,18 +177,37 @@ class ImmichAPI:
             log("Failed to retrieve all users. This may require admin privileges.", fg="red", verbose_only=False, verbose=self.verbose)
             return None
 
-    def _fetch_all_people(self):
+    def _fetch_all_people(self, refresh=False):
+        if self.people is not None and not refresh:
+            return self.people
+
+        cache_key = ["people", self.server_url, self.api_key]
+        if self.cache is not None and not refresh:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                log("Using cached people list", verbose_only=True, verbose=self.verbose)
+                self.people = cached
+                self.person_map = None
+                return self.people
+
         url = f"{self.server_url}/api/people"
         all_people = []
         page = 1
         while True:
             params = {'page': page, 'withHidden': 'true'}
             response_data = self._request('get', url, params=params)
-            if response_data is None or not response_data.get('people'):
+            if response_data is None:
+                break
+            if not response_data.get('people'):
+                # Only a complete listing is worth keeping for later runs
+                if self.cache is not None:
+                    self.cache.set(cache_key, all_people)
                 break
             all_people.extend(response_data['people'])
             page += 1
-        return all_people
+        self.people = all_people
+        self.person_map = None
+        return self.people
 
     def get_people(self):
         log("Fetching all named people...", verbose_only=False, verbose=self.verbose)
@@ -164,20 +231,29 @@ class ImmichAPI:
             log("Failed to retrieve any people.", fg="red", verbose_only=False, verbose=self.verbose)
             return None
 
-    def get_person_ids_from_names(self, identifiers, all_people):
+    def _build_person_map(self, all_people):
         person_map = {}
         for person in all_people:
             if 'name' in person and person['name']:
                 if person['name'] not in person_map:
                     person_map[person['name']] = []
                 person_map[person['name']].append(person['id'])
+        return person_map
+
+    def get_person_ids_from_names(self, identifiers, all_people=None):
+        # The name -> ids map for the server's people is built once and reused across calls
+        if all_people is None or all_people is self.people:
+            if self.person_map is None:
+                self.person_map = self._build_person_map(self._fetch_all_people())
+            person_map = self.person_map
+        else:
+            person_map = self._build_person_map(all_people)
 
-        uuid_regex = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
         resolved_ids = []
         for identifier in identifiers:
-            if uuid_regex.match(identifier):
+            if UUID_RE.fullmatch(identifier):
                 resolved_ids.append(identifier)
-                log(f"Identifier '{identifier}' is a UUID, using it directly.", verbose_only=True, verbose=self.verbose)
+                log("Identifier '{}' is a UUID, using it directly.", identifier, verbose_only=True, verbose=self.verbose)
                 continue
             
             if identifier in person_map:
@@ -186,63 +262,151 @@ class ImmichAPI:
                     log(f"Warning: Found multiple people named '{identifier}'. Resolving to all of them: {ids}", fg="yellow", verbose_only=False, verbose=self.verbose)
                 resolved_ids.extend(ids)
                 for person_id in ids:
-                    log(f"Resolved person name '{identifier}' to ID '{person_id}'.", verbose_only=True, verbose=self.verbose)
+                    log("Resolved person name '{}' to ID '{}'.", identifier, person_id, verbose_only=True, verbose=self.verbose)
             else:
                 log(f"Could not find a person with name or UUID '{identifier}'.", fg="yellow", verbose_only=False, verbose=self.verbose)
         return resolved_ids
 
-    def execute_search(self, query, search_type):
+    def _search_page(self, url, base_payload, search_type, page):
+        # Pages may be in flight concurrently, so each gets its own shallow copy
+        payload = dict(base_payload, page=page)
+
+        log("Executing {} search (page {})", search_type, page, verbose_only=True, verbose=self.verbose)
+        return self._request('post', url, json_data=payload)
+
+    def _select_assets(self, assets):
+        """Applies asset_predicate and asset_fields to a list of search results."""
+        if self.asset_predicate is not None:
+            predicate = self.asset_predicate
+            assets = [asset for asset in assets if predicate(asset)]
+        if self.asset_fields is not None:
+            fields = self.asset_fields
+            assets = [{k: v for k, v in asset.items() if k in fields} for asset in assets]
+        return assets
+
+    def execute_search(self, query, search_type, early_stop=None):
+        """Runs a paginated search. early_stop, if given, is called with the assets
+        collected so far after each page and ends the search when it returns True."""
         url = f"{self.server_url}/api/search/{search_type}"
         result_limit = query.get("resultLimit") if query and "resultLimit" in query else None
         if result_limit:
             log(f"Using result limit: {result_limit} for {search_type} search", verbose_only=True, verbose=self.verbose)
-        
+
+        search_key = (search_type, json.dumps(query, sort_keys=True))
+        if search_key in self._search_results:
+            log(f"Reusing results of an identical {search_type} search", verbose_only=True, verbose=self.verbose)
+            return self._search_results[search_key]
+
+        # Exif data is the bulk of each asset; only ask for it when local filters may read it
+        with_exif = self.asset_fields is None or "exifInfo" in self.asset_fields
+
+        # Cached results are stored unfiltered, since the local filters may differ between runs
+        cache_key = None
+        raw_assets = None
+        if self.cache is not None:
+            cache_key = ["search", self.server_url, self.api_key, search_type, query, with_exif]
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                log(f"Using cached {search_type} search results ({len(cached)} assets)", verbose_only=True, verbose=self.verbose)
+                all_assets = self._select_assets(cached)
+                self._search_results[search_key] = all_assets
+                return all_assets
+            raw_assets = []
+
+        complete = False
         all_assets = []
+        fetched = 0
         page = 1
         size = 100
-        while True:
-            payload = query.copy() if query else {}
-            payload["page"] = page
-            payload["withExif"] = True
-            payload["size"] = size
-            
-            log(f"Executing {search_type} search (page {page})", verbose_only=True, verbose=self.verbose)
-            result = self._request('post', url, json_data=payload)
-            
-            if not result or "assets" not in result:
-                log(f"Search returned no valid results on page {page}", fg="yellow", verbose_only=True, verbose=self.verbose)
-                break
+        last_page = -(-result_limit // size) if result_limit else None
+        base_payload = dict(query or {}, withExif=with_exif, size=size)
 
-            assets = result.get("assets", {}).get("items", [])
-            all_assets.extend(assets)
+        # The API only tells us whether a next page exists, so later pages are
+        # fetched speculatively. The prefetch window starts at one page and
+        # doubles while full pages keep coming, so small searches cost a
+        # single request.
+        window = 1
+        next_to_submit = 1
+        pending = {}
+        with ThreadPoolExecutor(max_workers=SEARCH_PREFETCH_PAGES) as executor:
+            while True:
+                # last_page only caps prefetching: it assumes full pages, and a
+                # short page can still be followed by more
+                while next_to_submit < page + window and (last_page is None or next_to_submit <= max(last_page, page)):
+                    pending[next_to_submit] = executor.submit(self._search_page, url, base_payload, search_type, next_to_submit)
+                    next_to_submit += 1
 
-            if result_limit and len(all_assets) >= result_limit:
-                log(f"Reached result limit ({result_limit}), stopping search", verbose_only=True, verbose=self.verbose)
-                all_assets = all_assets[:result_limit]
-                break
+                result = pending.pop(page).result()
 
-            if result.get("assets", {}).get("nextPage") is None:
-                log(f"Reached last page ({page}), total assets: {len(all_assets)}", verbose_only=True, verbose=self.verbose)
-                break
-                
-            log(f"Retrieved {len(assets)} assets from page {page}", verbose_only=True, verbose=self.verbose)
-            page += 1
-            
+                if not result or "assets" not in result:
+                    log(f"Search returned no valid results on page {page}", fg="yellow", verbose_only=True, verbose=self.verbose)
+                    break
+
+                assets_page = result["assets"] or {}
+                items = assets_page.get("items", [])
+                assets = items
+                if result_limit:
+                    # The limit counts results as ranked by the server, before any local filtering
+                    assets = assets[:result_limit - fetched]
+                fetched += len(assets)
+                if raw_assets is not None:
+                    raw_assets.extend(assets)
+                assets = self._select_assets(assets)
+                all_assets.extend(assets)
+
+                if result_limit and fetched >= result_limit:
+                    log(f"Reached result limit ({result_limit}), stopping search", verbose_only=True, verbose=self.verbose)
+                    complete = True
+                    break
+
+                if early_stop and early_stop(all_assets):
+                    log(f"Collected enough assets after page {page}, stopping search", verbose_only=True, verbose=self.verbose)
+                    break
+
+                if assets_page.get("nextPage") is None:
+                    log(f"Reached last page ({page}), total assets: {len(all_assets)}", verbose_only=True, verbose=self.verbose)
+                    complete = True
+                    break
+                    
+                log("Retrieved {} assets from page {}", len(assets), page, verbose_only=True, verbose=self.verbose)
+                page += 1
+                if len(items) >= size:
+                    window = min(window * 2, SEARCH_PREFETCH_PAGES)
+
+            for future in pending.values():
+                future.cancel()
+
+        # Searches cut short by early_stop or an error would be incomplete for later callers
+        if complete:
+            self._search_results[search_key] = all_assets
+            if cache_key is not None:
+                self.cache.set(cache_key, raw_assets)
         return all_assets
 
+    def execute_searches(self, queries, search_type):
+        """Runs independent searches concurrently, returning their results in query order."""
+        if len(queries) <= 1:
+            return [self.execute_search(query, search_type) for query in queries]
+        with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+            return list(executor.map(lambda query: self.execute_search(query, search_type), queries))
+
     def add_assets_to_album(self, album_id, asset_ids, chunk_size=500):
         url = f"{self.server_url}/api/albums/{album_id}/assets"
         total_added = 0
         asset_ids_list = list(asset_ids)
-        for i in range(0, len(asset_ids_list), chunk_size):
-            chunk = asset_ids_list[i:i+chunk_size]
-            payload = {"ids": chunk}
+        chunks = [asset_ids_list[i:i+chunk_size] for i in range(0, len(asset_ids_list), chunk_size)]
+        for index, chunk in enumerate(chunks):
+            i = index * chunk_size
             log(f"Adding chunk of {len(chunk)} assets to album {album_id} ({i+1}-{i+len(chunk)} of {len(asset_ids_list)})", verbose_only=False, verbose=self.verbose)
-            result = self._request('put', url, json_data=payload)
-            if result is not None:
-                total_added += len(chunk)
-                for aid in chunk:
-                    log(f"{self.server_url}/photos/{aid}", verbose_only=False, verbose=self.verbose)
+
+        # Adding ids to an album is idempotent, so chunks can be sent concurrently.
+        with ThreadPoolExecutor(max_workers=ALBUM_UPDATE_WORKERS) as executor:
+            results = executor.map(lambda chunk: self._request('put', url, json_data={"ids": chunk}), chunks)
+            for chunk, result in zip(chunks, results):
+                if result is not None:
+                    total_added += len(chunk)
+                    for aid in chunk:
+                        log(f"{self.server_url}/photos/{aid}", verbose_only=False, verbose=self.verbose)
         
         log(f"Added {total_added} of {len(asset_ids_list)} assets to album", 
             fg="green" if total_added == len(asset_ids_list) else "yellow", 
@@ -0,0 +1,55 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from .logger import log
+from . import jsonutil
+
+def default_cache_dir():
+    """Returns $XDG_CACHE_HOME/immich-smart-albums, falling back to ~/.cache."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "immich-smart-albums")
+
+class DiskCache:
+    """Stores JSON values in files named by a hash of their key; entries older
+    than ttl seconds are treated as missing."""
+
+    def __init__(self, directory, ttl, verbose=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.verbose = verbose
+
+    def _path(self, key):
+        encoded = json.dumps(key, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        return os.path.join(self.directory, hashlib.sha256(encoded).hexdigest() + ".json")
+
+    def get(self, key):
+        """Returns the cached value for key, or None if it is missing, expired or unreadable."""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, 'rb') as f:
+                return jsonutil.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            log(f"Ignoring unreadable cache file {path}: {e}", fg="yellow", verbose_only=True, verbose=self.verbose)
+            return None
+
+    def set(self, key, value):
+        """Writes value for key; the file is replaced atomically so readers never see a partial entry."""
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(jsonutil.dumps(value))
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            log(f"Could not write cache file {path}: {e}", fg="yellow", verbose_only=True, verbose=self.verbose)
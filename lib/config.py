@@ -3,6 +3,7 @@ import argparse
 import os
 import sys
 from dotenv import load_dotenv
+from .cache import default_cache_dir
 
 def get_config():
     load_dotenv()
@@ -17,6 +18,9 @@ def get_config():
     parser.add_argument("--album", help="ID of the album to add matching assets to (optional)")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose output for debugging")
     parser.add_argument("--max-assets", type=int, help="Maximum number of assets to process after all filters are applied. This limits both the console output (in preview mode) and the number of assets added to an album. Note: Selection is arbitrary as it operates on an unordered set.", default=None)
+    parser.add_argument("--cache-ttl", type=int, help="Reuse search results, people and albums cached on disk by an earlier run for up to this many seconds (env: IMMICH_CACHE_TTL). Default 0 disables the cache.", default=None)
+    parser.add_argument("--cache-dir", help="Directory for the on-disk cache (env: IMMICH_CACHE_DIR). Defaults to ~/.cache/immich-smart-albums.", default=None)
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the on-disk cache, even if a cache TTL is configured")
     parser.add_argument("--default-smart-result-limit", type=int, help="Default result limit for smart searches. This is a global setting with a default value of 200. It can be adjusted per query using the '@' notation (e.g., 'dog@500').", default=200)
 
     # Define flags in dictionaries for easier looping.
@@ -47,25 +51,26 @@ def get_config():
         args.key = os.environ.get("IMMICH_API_KEY")
     if args.server is None:
         args.server = os.environ.get("IMMICH_SERVER_URL")
+    if args.cache_ttl is None:
+        cache_ttl = os.environ.get("IMMICH_CACHE_TTL")
+        args.cache_ttl = int(cache_ttl) if cache_ttl and cache_ttl.isdigit() else 0
+    if args.cache_dir is None:
+        args.cache_dir = os.environ.get("IMMICH_CACHE_DIR") or default_cache_dir()
 
     return args
 
+SEARCH_FLAGS = (
+    'include_smart_union', 'include_smart_intersection',
+    'exclude_smart_union', 'exclude_smart_intersection',
+    'include_metadata_union', 'include_metadata_intersection',
+    'exclude_metadata_union', 'exclude_metadata_intersection',
+    'include_local_filter_union', 'include_local_filter_intersection',
+    'exclude_local_filter_union', 'exclude_local_filter_intersection',
+    'include_person_names_union', 'include_person_names_intersection',
+    'exclude_person_names_union', 'exclude_person_names_intersection',
+    'include_person_ids_union', 'include_person_ids_intersection',
+    'exclude_person_ids_union', 'exclude_person_ids_intersection'
+)
+
 def has_search_actions(args):
-    search_flags = [
-        'include_smart_union', 'include_smart_intersection',
-        'exclude_smart_union', 'exclude_smart_intersection',
-        'include_metadata_union', 'include_metadata_intersection',
-        'exclude_metadata_union', 'exclude_metadata_intersection',
-        'include_local_filter_union', 'include_local_filter_intersection',
-        'exclude_local_filter_union', 'exclude_local_filter_intersection',
-        'include_person_names_union', 'include_person_names_intersection',
-        'exclude_person_names_union', 'exclude_person_names_intersection',
-        'include_person_ids_union', 'include_person_ids_intersection',
-        'exclude_person_ids_union', 'exclude_person_ids_intersection'
-    ]
-    
-    for flag in search_flags:
-        if hasattr(args, flag) and getattr(args, flag):
-            return True
-    
-    return False
+    return any(getattr(args, flag, None) for flag in SEARCH_FLAGS)
@@ -1,19 +1,23 @@
 import json
 import os
 import re
+from functools import lru_cache
 from jsonpath_ng import parse
 from .logger import log
+from . import jsonutil
 
 def normalize_json_query(query_input, verbose=False):
     """Parses a query input, which can be a file path or a JSON string."""
-    # Try parsing as JSON string first
-    try:
-        data = json.loads(query_input)
-        if isinstance(data, dict):
-            log(f"Parsed as JSON string: {data}", verbose_only=True, verbose=verbose)
-            return data
-    except json.JSONDecodeError:
-        pass  # Not a valid JSON string, proceed to file check
+    # Try parsing as JSON string first; only an object is accepted, so anything
+    # else (file paths, plain smart queries) skips the parse attempt entirely
+    if str(query_input).lstrip().startswith('{'):
+        try:
+            data = json.loads(query_input)
+            if isinstance(data, dict):
+                log(f"Parsed as JSON string: {data}", verbose_only=True, verbose=verbose)
+                return data
+        except json.JSONDecodeError:
+            pass  # Not a valid JSON string, proceed to file check
 
     # Check if it's a file path
     if os.path.exists(str(query_input)) and str(query_input).endswith('.json'):
@@ -22,6 +26,9 @@ def normalize_json_query(query_input, verbose=False):
     return None
 
 
+# 'query @limit' shorthand for smart searches
+_LIMIT_RE = re.compile(r'^(.*?)\s*@\s*(\d+)$')
+
 def normalize_query(query_input, default_result_limit, verbose=False):
     """Parses a query input, which can be a file path, a JSON string, a plain query, or a query with a result limit.
     Ensures the output is a dictionary with 'query' and 'resultLimit'."""
@@ -34,7 +41,7 @@ def normalize_query(query_input, default_result_limit, verbose=False):
         return json_data
 
     # Handle 'query @limit' shorthand and plain query for smart searches
-    match = re.match(r'^(.*)\s*@\s*(\d+)$', query_input)
+    match = _LIMIT_RE.match(query_input)
     if match:
         query = match.group(1).strip()
         limit = int(match.group(2))
@@ -48,14 +55,157 @@ def normalize_query(query_input, default_result_limit, verbose=False):
 
 def load_json_file(file_path, verbose=False):
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        with open(file_path, 'rb') as f:
+            data = jsonutil.loads(f.read())
         log(f"Successfully loaded JSON from {file_path}", verbose_only=True, verbose=verbose)
         return data
     except (json.JSONDecodeError, FileNotFoundError) as e:
         log(f"Error loading JSON file {file_path}: {str(e)}", fg="red", verbose_only=False, verbose=verbose)
         return None
 
+_SIMPLE_PATH_RE = re.compile(r'^(?:\$|[A-Za-z_]\w*)(?:\.[A-Za-z_]\w*|\[\*\]|\[\d+\])*$', re.ASCII)
+_PATH_STEP_RE = re.compile(r'\.?([A-Za-z_]\w*)|\[(\*|\d+)\]', re.ASCII)
+_JSONPATH_RESERVED = {'where', 'wherenot'}
+
+def _simple_path_steps(path):
+    """Splits a plain dotted JSONPath into ('key', name), ('all', None) and
+    ('index', n) steps. Returns None for anything jsonpath_ng has to evaluate."""
+    if not isinstance(path, str) or not _SIMPLE_PATH_RE.match(path):
+        return None
+    steps = []
+    for name, index in _PATH_STEP_RE.findall(path.lstrip('$')):
+        if name:
+            if name in _JSONPATH_RESERVED:
+                return None
+            steps.append(('key', name))
+        elif index == '*':
+            steps.append(('all', None))
+        else:
+            steps.append(('index', int(index)))
+    return steps
+
+# apply_local_filters runs up to four times per invocation, often on the same paths
+@lru_cache(maxsize=256)
+def compile_path(path):
+    """Compiles a JSONPath into a function returning the list of matched values.
+    Plain dotted paths with '[*]' or '[n]' steps are walked directly; anything
+    else is delegated to jsonpath_ng. Both return the same values."""
+    steps = _simple_path_steps(path)
+    if steps is not None:
+        return lambda obj: _walk_path(obj, steps)
+
+    jsonpath_expr = parse(path)
+    return lambda obj: [match.value for match in jsonpath_expr.find(obj)]
+
+def required_asset_fields(filters):
+    """Returns the top-level asset keys the given filters can read, always
+    including 'id', or None if some path may reach any key (e.g. '$..make')."""
+    fields = {"id"}
+    for f in filters:
+        steps = _simple_path_steps(f.get("path")) if isinstance(f, dict) else None
+        if not steps or steps[0][0] != 'key':
+            return None
+        fields.add(steps[0][1])
+    return fields
+
+def _walk_path(obj, steps):
+    values = [obj]
+    for kind, arg in steps:
+        found = []
+        for value in values:
+            if kind == 'key':
+                if isinstance(value, dict) and arg in value:
+                    found.append(value[arg])
+            elif kind == 'all':
+                # jsonpath_ng treats a scalar or object under [*] as a one-element list
+                if isinstance(value, list):
+                    found.extend(value)
+                elif value is not None:
+                    found.append(value)
+            elif isinstance(value, (list, str)) and arg < len(value):
+                found.append(value[arg])
+        if not found:
+            return found
+        values = found
+    return values
+
+# Used with fullmatch: a trailing '$' would also accept a regex ending in '\n'
+_LITERAL_ANCHORED_RE = re.compile(r'\^([A-Za-z0-9_/ -]+)(\$|\.\*)?')
+_LENGTH_RANGE_RE = re.compile(r'\^\.\{(\d+)(?:,(\d+))?\}\$')
+_PLAIN_LITERAL_RE = re.compile(r'[A-Za-z0-9_/ -]+')
+
+def classify_regex(regex):
+    """Returns (kind, literal) for a filter regex. kind is one of 'always',
+    'nonempty', 'equals', 'prefix', 'contains', 'length' or 'regex'; literal is
+    set for the equality, prefix and contains kinds and is a (min, max) pair for
+    '^.{m,n}$', all of which can be answered without the regex engine."""
+    if regex == '.*':
+        return 'always', None
+    if regex == '.+':
+        return 'nonempty', None
+    match = _LITERAL_ANCHORED_RE.fullmatch(regex)
+    if match:
+        return ('equals' if match.group(2) == '$' else 'prefix'), match.group(1).lower()
+    if _PLAIN_LITERAL_RE.fullmatch(regex):
+        return 'contains', regex.lower()
+    match = _LENGTH_RANGE_RE.fullmatch(regex)
+    if match:
+        low = int(match.group(1))
+        high = int(match.group(2)) if match.group(2) is not None else low
+        if low <= high:
+            return 'length', (low, high)
+    return 'regex', None
+
+@lru_cache(maxsize=256)
+def compile_regex_matcher(regex):
+    """Compiles a filter regex into a case-insensitive predicate on strings.
+    Trivial patterns ('.*', '.+', 'literal', '^literal', '^literal$', '^.{m,n}$')
+    skip the regex engine for ASCII input."""
+    pattern = re.compile(regex, re.IGNORECASE)
+    search = pattern.search
+    kind, literal = classify_regex(regex)
+    if kind == 'always':
+        return lambda s: True
+    if kind == 'nonempty':
+        # '.' matches anything but a newline
+        return lambda s: bool(s.strip('\n'))
+    if kind == 'prefix':
+        length = len(literal)
+        def match_prefix(s):
+            head = s[:length]
+            if head.isascii():
+                return head.lower() == literal
+            return search(s) is not None
+        return match_prefix
+    if kind == 'equals':
+        def match_equals(s):
+            # '$' also matches just before a trailing newline
+            value = s[:-1] if s.endswith('\n') else s
+            if value.isascii():
+                return value.lower() == literal
+            return search(s) is not None
+        return match_equals
+    if kind == 'contains':
+        def match_contains(s):
+            if s.isascii():
+                return literal in s.lower()
+            return search(s) is not None
+        return match_contains
+    if kind == 'length':
+        low, high = literal
+        def match_length(s):
+            if '\n' not in s:
+                return low <= len(s) <= high
+            return search(s) is not None
+        return match_length
+    return lambda s: search(s) is not None
+
+# First characters of JSON values that can appear as raw filter input
+_JSON_VALUE_START = '[{"-0123456789tfn'
+
+# Assets evaluated between re-sorting intersection filters by rejection count.
+FILTER_REORDER_INTERVAL = 1024
+
 class Filter:
     def __init__(self, verbose=False):
         self.verbose = verbose
@@ -64,7 +214,8 @@ class Filter:
         filters = []
         for inp in filter_inputs or []:
             data = None
-            if os.path.exists(inp):
+            # Inline JSON filters are common, so they skip the filesystem check
+            if inp.lstrip()[:1] not in ('[', '{') and os.path.exists(inp):
                 data = load_json_file(inp, self.verbose)
                 if data and isinstance(data, list):
                     filters.extend(data)
@@ -72,81 +223,159 @@ class Filter:
                 elif data:
                     log(f"Filter file {inp} must contain a JSON array", fg="red", verbose_only=False, verbose=self.verbose)
             else:
-                try:
-                    data = json.loads(inp)
-                    if isinstance(data, list):
-                        filters.extend(data)
-                        log(f"Loaded {len(data)} filters from raw JSON value", verbose_only=True, verbose=self.verbose)
+                error = "not a JSON array, file path or path:regex pair"
+                # Only inputs that can start a JSON value are tried as JSON; '$.' paths never can
+                if inp.lstrip()[:1] in _JSON_VALUE_START:
+                    try:
+                        data = json.loads(inp)
+                    except json.JSONDecodeError as e:
+                        error = e
                     else:
-                        log(f"Raw JSON input must be a JSON array, got {type(data).__name__}", fg="red", verbose_only=False, verbose=self.verbose)
-                except Exception as e:
-                    parts = inp.split(':', 1)
-                    if len(parts) == 2:
-                        filters.append({"path": parts[0], "regex": parts[1]})
-                        log(f"Added filter from command line: {inp}", verbose_only=True, verbose=self.verbose)
-                    else:
-                        log(f"Error parsing filter input {inp}: {e}", fg="red", verbose_only=False, verbose=self.verbose)
+                        if isinstance(data, list):
+                            filters.extend(data)
+                            log(f"Loaded {len(data)} filters from raw JSON value", verbose_only=True, verbose=self.verbose)
+                        else:
+                            log(f"Raw JSON input must be a JSON array, got {type(data).__name__}", fg="red", verbose_only=False, verbose=self.verbose)
+                        continue
+                parts = inp.split(':', 1)
+                if len(parts) == 2:
+                    filters.append({"path": parts[0], "regex": parts[1]})
+                    log(f"Added filter from command line: {inp}", verbose_only=True, verbose=self.verbose)
+                else:
+                    log(f"Error parsing filter input {inp}: {error}", fg="red", verbose_only=False, verbose=self.verbose)
+
+        for filter_item in filters:
+            if isinstance(filter_item, dict) and filter_item.get("regex"):
+                try:
+                    filter_item["_regex_matcher"] = compile_regex_matcher(filter_item["regex"])
+                except (re.error, TypeError) as e:
+                    log(f"Invalid regex '{filter_item['regex']}' in filter: {e}", fg="red", verbose_only=False, verbose=self.verbose)
         return filters
 
+    def _extract_column(self, path, assets):
+        """Evaluates one JSONPath against every asset, returning the matched values per asset."""
+        find_values = compile_path(path)
+        column = []
+        for asset in assets:
+            try:
+                column.append(find_values(asset))
+            except Exception as e:
+                log("JSONPath error for asset {} with expression '{}': {}", asset['id'], path, e, fg="red", verbose_only=True, verbose=self.verbose)
+                column.append([])
+        return column
+
+    def _asset_test(self, f):
+        """Compiles one filter into a predicate on a single asset; invalid filters never match."""
+        try:
+            find_values = compile_path(f.get("path"))
+            regex = f.get("regex")
+            matcher = (f.get("_regex_matcher") or compile_regex_matcher(regex)) if regex else None
+        except Exception:
+            return lambda asset: False
+
+        def test(asset):
+            try:
+                values = find_values(asset)
+            except Exception:
+                return False
+            if matcher is None:
+                return bool(values)
+            return any(value is not None and matcher(str(value)) for value in values)
+        return test
+
+    def build_include_predicate(self, union_filters, intersection_filters):
+        """Returns a predicate telling whether an asset can pass the local include
+        filters, or None if there are none. Verdicts are memoized by asset id."""
+        if not union_filters and not intersection_filters:
+            return None
+        union_tests = [self._asset_test(f) for f in union_filters or []]
+        intersection_tests = [self._asset_test(f) for f in intersection_filters or []]
+        # Intersection filters are tried most-rejecting first, so a failing asset
+        # is usually turned away by the first test
+        rejects = [0] * len(intersection_tests)
+        order = list(range(len(intersection_tests)))
+        verdicts = {}
+
+        def passes_intersection(asset):
+            for i in order:
+                if not intersection_tests[i](asset):
+                    rejects[i] += 1
+                    return False
+            return True
+
+        def predicate(asset):
+            nonlocal order
+            asset_id = asset["id"]
+            verdict = verdicts.get(asset_id)
+            if verdict is None:
+                verdict = (not union_tests or any(test(asset) for test in union_tests)) and \
+                    passes_intersection(asset)
+                verdicts[asset_id] = verdict
+                if len(order) > 1 and len(verdicts) % FILTER_REORDER_INTERVAL == 0:
+                    # Rebind rather than sort in place: searches may run on several threads
+                    order = sorted(order, key=lambda i: -rejects[i])
+            return verdict
+        return predicate
+
     def apply_local_filters(self, assets, filters, is_include=True, use_intersection=True):
         if not filters:
             return {asset["id"] for asset in assets} if is_include else set()
-        
-        filtered_assets = set()
-        filter_counts = {}
-        asset_matches = {asset["id"]: set() for asset in assets}
 
+        asset_ids = [asset["id"] for asset in assets]
+
+        # Filters are evaluated column-wise: each distinct path is extracted from
+        # every asset once, then each filter scans the column of its path.
+        columns = {}
+        string_columns = {}
+        filter_results = []
         for f in filters:
             path = f.get("path")
             regex = f.get("regex")
             description = f.get("description", f"{path}:{regex}")
-            filter_counts[description] = 0
+            matched = set()
+            filter_results.append((description, matched))
+            try:
+                matcher = (f.get("_regex_matcher") or compile_regex_matcher(regex)) if regex else None
+                if path not in columns:
+                    columns[path] = self._extract_column(path, assets)
+            except Exception as e:
+                log(f"Invalid filter '{description}': {str(e)}", fg="red", verbose_only=True, verbose=self.verbose)
+                continue
 
-        for asset in assets:
-            asset_id = asset["id"]
-            matched_filters = set()
-            for f in filters:
-                path = f.get("path")
-                regex = f.get("regex")
-                description = f.get("description", f"{path}:{regex}")
-                try:
-                    jsonpath_expr = parse(path)
-                    matches = [match.value for match in jsonpath_expr.find(asset)]
-                    if matches:
-                        if regex:
-                            if any(match is not None and re.search(regex, str(match), re.IGNORECASE) for match in matches):
-                                matched_filters.add(description)
-                                asset_matches[asset_id].add(description)
-                                filter_counts[description] += 1
-                                log(f"Asset {asset_id} matched filter: {description}", verbose_only=True, verbose=self.verbose)
-                        else:
-                            matched_filters.add(description)
-                            asset_matches[asset_id].add(description)
-                            filter_counts[description] += 1
-                            log(f"Asset {asset_id} matched path: {path}", verbose_only=True, verbose=self.verbose)
-                except Exception as e:
-                    log(f"JSONPath error for asset {asset_id} with expression '{path}': {str(e)}", fg="red", verbose_only=True, verbose=self.verbose)
-
-            if is_include:
-                if use_intersection:
-                    if len(matched_filters) == len(filters):
-                        filtered_assets.add(asset_id)
-                        log(f"Asset {asset_id} matched ALL include filters (intersection mode)", verbose_only=True, verbose=self.verbose)
-                else:
-                    if matched_filters:
-                        filtered_assets.add(asset_id)
-                        log(f"Asset {asset_id} matched at least one include filter (union mode)", verbose_only=True, verbose=self.verbose)
-            else: # is_exclude
+            if matcher:
+                if path not in string_columns:
+                    string_columns[path] = [[str(value) for value in values if value is not None] for values in columns[path]]
+                for asset_id, values in zip(asset_ids, string_columns[path]):
+                    if any(matcher(value) for value in values):
+                        matched.add(asset_id)
+            else:
+                for asset_id, values in zip(asset_ids, columns[path]):
+                    if values:
+                        matched.add(asset_id)
+
+            # Per-asset messages are only formatted when they will be printed
+            if self.verbose:
+                for asset_id in matched:
+                    if matcher:
+                        log(f"Asset {asset_id} matched filter: {description}", verbose_only=True, verbose=self.verbose)
+                    else:
+                        log(f"Asset {asset_id} matched path: {path}", verbose_only=True, verbose=self.verbose)
+
+        matched_sets = [matched for _, matched in filter_results]
+        if use_intersection:
+            filtered_assets = set.intersection(*sorted(matched_sets, key=len))
+        else:
+            filtered_assets = set().union(*matched_sets)
+
+        if self.verbose:
+            kind = "include" if is_include else "exclude"
+            for asset_id in filtered_assets:
                 if use_intersection:
-                    if len(matched_filters) == len(filters):
-                        filtered_assets.add(asset_id)
-                        log(f"Asset {asset_id} matched ALL exclude filters (intersection mode)", verbose_only=True, verbose=self.verbose)
+                    log(f"Asset {asset_id} matched ALL {kind} filters (intersection mode)", verbose_only=True, verbose=self.verbose)
                 else:
-                    if matched_filters:
-                        filtered_assets.add(asset_id)
-                        log(f"Asset {asset_id} matched at least one exclude filter (union mode)", verbose_only=True, verbose=self.verbose)
+                    log(f"Asset {asset_id} matched at least one {kind} filter (union mode)", verbose_only=True, verbose=self.verbose)
 
-        for desc, count in filter_counts.items():
-            log(f"Filter '{desc}' ({'include' if is_include else 'exclude'}, {'intersection' if use_intersection else 'union'} mode) matched {count} assets", verbose_only=False, verbose=self.verbose)
+        for desc, matched in filter_results:
+            log(f"Filter '{desc}' ({'include' if is_include else 'exclude'}, {'intersection' if use_intersection else 'union'} mode) matched {len(matched)} assets", verbose_only=False, verbose=self.verbose)
         
-        return filtered_assets
\ No newline at end of file
+        return filtered_assets
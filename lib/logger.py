@@ -1,10 +1,19 @@
-def log(message, fg=None, verbose_only=True, verbose=False):
+import threading
+
+# Searches run on worker threads; keep each message on its own line
+_print_lock = threading.Lock()
+
+def log(message, *args, fg=None, verbose_only=True, verbose=False):
+    """Prints message, optionally colored. With args, message is a str.format
+    pattern filled in only when the message is actually printed."""
     if not verbose_only or verbose:
+        if args:
+            message = message.format(*args)
         if fg == "red":
-            print(f"\033[91m{message}\033[0m")
+            message = f"\033[91m{message}\033[0m"
         elif fg == "green":
-            print(f"\033[92m{message}\033[0m")
+            message = f"\033[92m{message}\033[0m"
         elif fg == "yellow":
-            print(f"\033[93m{message}\033[0m")
-        else:
+            message = f"\033[93m{message}\033[0m"
+        with _print_lock:
             print(message)